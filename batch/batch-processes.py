@@ -0,0 +1,103 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import asyncio
+import multiprocessing
+import os
+
+"""
+Parallel execution with one model per worker process.
+
+A single Llama instance is not safe to use from several threads at once, so
+sharing it between asyncio executors only serializes (or freezes) the calls.
+This variant keeps the plain create_chat_completion API and gets real CPU
+parallelism by loading the model once in every worker process. Each worker
+is pinned to its own set of cores so the llama.cpp thread pools don't fight
+over the same CPUs. The price is memory: the model is loaded N times.
+
+See batch.py for the single-model alternative using batched decoding.
+"""
+
+# Get the directory of the current file
+current_dir = Path(__file__).parent
+model_path = str(current_dir / ".." / "models" / "DeepSeek-R1-0528-Qwen3-8B-Q6_K.gguf")
+
+N_WORKERS = 2
+
+# The model owned by the current worker process
+_LLAMA = None
+
+
+def _load_model(path: str, n_workers: int, worker_counter) -> None:
+    """Initialize a worker: pin it to its own cores and load the model"""
+    global _LLAMA
+
+    # Only the workers need llama.cpp; the parent process never loads it
+    from llama_cpp import Llama
+
+    with worker_counter.get_lock():
+        worker_index = worker_counter.value
+        worker_counter.value += 1
+
+    # Split the cores this process may run on (a cpuset can restrict them to
+    # fewer than os.cpu_count()) and bind each worker to its own share (Linux only)
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        n_threads = max(1, len(cores) // n_workers)
+        own_cores = cores[worker_index * n_threads:(worker_index + 1) * n_threads]
+        if own_cores:
+            os.sched_setaffinity(0, own_cores)
+    else:
+        n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+
+    _LLAMA = Llama(
+        model_path=path,
+        n_ctx=2048,
+        n_batch=1024,  # The number of tokens that can be processed at once
+        n_threads=n_threads,
+        # CPU by default: this variant exists for CPU parallelism, and offloading
+        # would put a full copy of the model into VRAM for every worker
+        n_gpu_layers=int(os.getenv("N_GPU_LAYERS", "0")),
+        verbose=False
+    )
+
+
+def _chat(prompt: str) -> str:
+    """Run a chat completion on the worker's own model"""
+    response = _LLAMA.create_chat_completion(
+        messages=[{"role": "user", "content": prompt}]
+    )
+    return response["choices"][0]["message"]["content"]
+
+
+async def process_prompt(pool: ProcessPoolExecutor, prompt: str, label: str):
+    """Process a single prompt in one of the worker processes"""
+    loop = asyncio.get_running_loop()
+    answer = await loop.run_in_executor(pool, _chat, prompt)
+    return label, prompt, answer
+
+
+async def main():
+    worker_counter = multiprocessing.Value("i", 0)
+
+    with ProcessPoolExecutor(
+        max_workers=N_WORKERS,
+        initializer=_load_model,
+        initargs=(model_path, N_WORKERS, worker_counter)
+    ) as pool:
+        q1 = "Hi there, how are you?"
+        q2 = "How much is 6+6?"
+
+        # Process both prompts in parallel, one per worker
+        results = await asyncio.gather(
+            process_prompt(pool, q1, "Q1"),
+            process_prompt(pool, q2, "Q2")
+        )
+
+    # Print results
+    for label, prompt, answer in results:
+        print(f"User: {prompt}")
+        print(f"AI: {answer}\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
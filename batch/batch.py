@@ -1,59 +1,68 @@
-from llama_cpp import Llama
 from pathlib import Path
-import asyncio
+import sys
+
+# Make the helper package importable (only once, even if several scripts share a process)
+root_dir = str(Path(__file__).resolve().parent.parent)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+from helper.batched_decoding import batched_chat_completion
+from helper.model_loader import gpu_layers
 
 """
 Asynchronous execution improves performance in GAIA benchmarks,
 multi-agent applications, and other high-throughput scenarios.
 
-Note: llama-cpp-python doesn't natively support multiple sequences like node-llama-cpp.
-This example demonstrates parallel execution using asyncio and separate model instances
-or by processing prompts in parallel batches.
+Note: a single Llama instance serializes create_chat_completion calls, so running
+them through asyncio executors does not make them parallel. Instead, this example
+uses llama.cpp's batched decoding: every prompt gets its own sequence id inside one
+llama_batch, so the prompts share a single prefill pass and their tokens are decoded
+side by side in every step (the Python equivalent of node-llama-cpp's sequences).
 """
 
 # Get the directory of the current file
 current_dir = Path(__file__).parent
 model_path = str(current_dir / ".." / "models" / "DeepSeek-R1-0528-Qwen3-8B-Q6_K.gguf")
 
+N_CTX = 2048
+N_BATCH = 1024  # The number of tokens that can be processed at once
+MAX_TOKENS = 1024  # Upper bound of generated tokens per sequence
+# Sampler settings recommended for DeepSeek-R1; greedy decoding makes reasoning
+# models repeat themselves until MAX_TOKENS
+TEMPERATURE = 0.6
+TOP_P = 0.95
 
-async def process_prompt(llama: Llama, prompt: str, label: str):
-    """Process a single prompt asynchronously"""
-    # In Python, we run the blocking call in an executor
-    loop = asyncio.get_event_loop()
-    response = await loop.run_in_executor(
-        None,
-        lambda: llama.create_chat_completion(
-            messages=[{"role": "user", "content": prompt}]
-        )
-    )
-    answer = response["choices"][0]["message"]["content"]
-    return label, prompt, answer
 
+def main():
+    from llama_cpp import Llama
 
-async def main():
-    # Initialize the model (can be shared for sequential processing)
-    # For true parallel processing, you'd need separate model instances or thread pooling
+    # The model is loaded once; the weights are shared by all sequences
     llama = Llama(
         model_path=model_path,
-        n_ctx=2048,
-        n_batch=1024,  # The number of tokens that can be processed at once
+        n_ctx=N_CTX,
+        n_batch=N_BATCH,
+        n_gpu_layers=gpu_layers(),
         verbose=False
     )
 
     q1 = "Hi there, how are you?"
     q2 = "How much is 6+6?"
 
-    # Process both prompts concurrently
-    results = await asyncio.gather(
-        process_prompt(llama, q1, "Q1"),
-        process_prompt(llama, q2, "Q2")
+    # Process both prompts in the same batched decode
+    answers = batched_chat_completion(
+        llama,
+        [[{"role": "user", "content": q}] for q in (q1, q2)],
+        n_ctx=N_CTX,
+        n_batch=N_BATCH,
+        max_tokens=MAX_TOKENS,
+        temperature=TEMPERATURE,
+        top_p=TOP_P
     )
 
     # Print results
-    for label, prompt, answer in results:
+    for prompt, answer in zip([q1, q2], answers):
         print(f"User: {prompt}")
         print(f"AI: {answer}\n")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -1,38 +1,55 @@
-from llama_cpp import Llama
 from pathlib import Path
+import sys
+
+# Make the helper package importable (only once, even if several scripts share a process)
+root_dir = str(Path(__file__).resolve().parent.parent)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+from helper.model_loader import gpu_layers
+from helper.stream_buffer import StreamBuffer
 
 # Get the directory of the current file
 current_dir = Path(__file__).parent
 
-# Initialize and load the model
-llama = Llama(
-    model_path=str(current_dir / ".." / "models" / "hf_giladgd_gpt-oss-20b.MXFP4.gguf"),
-    n_ctx=2048,
-    verbose=False
-)
-
-q1 = "What is hoisting in JavaScript? Explain with examples."
-
-print(f"Context size: {llama.n_ctx()}")
-
-# Create streaming chat completion
-response = llama.create_chat_completion(
-    messages=[
-        {"role": "user", "content": q1}
-    ],
-    max_tokens=2000,
-    stream=True
-)
-
-# Stream the response
-print("\nAI: ", end="", flush=True)
-full_response = ""
-for chunk in response:
-    if "choices" in chunk and len(chunk["choices"]) > 0:
-        delta = chunk["choices"][0].get("delta", {})
-        if "content" in delta:
-            content = delta["content"]
-            print(content, end="", flush=True)
-            full_response += content
-
-print(f"\n\nFinal answer:\n {full_response}")
+
+def main():
+    # Imported here: loading the native llama.cpp library is only worth it when the example runs
+    from llama_cpp import Llama
+
+    # Initialize and load the model
+    llama = Llama(
+        model_path=str(current_dir / ".." / "models" / "hf_giladgd_gpt-oss-20b.MXFP4.gguf"),
+        n_ctx=2048,
+        n_gpu_layers=gpu_layers(),
+        verbose=False
+    )
+
+    q1 = "What is hoisting in JavaScript? Explain with examples."
+
+    print(f"Context size: {llama.n_ctx()}")
+
+    # Create streaming chat completion
+    response = llama.create_chat_completion(
+        messages=[
+            {"role": "user", "content": q1}
+        ],
+        max_tokens=2000,
+        stream=True
+    )
+
+    # Stream the response (buffered, so not every token triggers a write + flush)
+    print("\nAI: ", end="", flush=True)
+    buf = StreamBuffer()
+    for chunk in response:
+        if "choices" in chunk and len(chunk["choices"]) > 0:
+            delta = chunk["choices"][0].get("delta", {})
+            if "content" in delta and delta["content"]:
+                buf.add(delta["content"])
+    buf.flush()
+    full_response = buf.text()
+
+    print(f"\n\nFinal answer:\n {full_response}")
+
+
+if __name__ == "__main__":
+    main()
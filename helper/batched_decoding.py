@@ -0,0 +1,213 @@
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+    from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+
+def get_chat_formatter(llama: "Llama") -> "Jinja2ChatFormatter":
+    """Chat formatter for the template stored in the model file"""
+    from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+    return Jinja2ChatFormatter(
+        template=llama.metadata["tokenizer.chat_template"],
+        eos_token=llama._model.token_get_text(llama.token_eos()),
+        bos_token=llama._model.token_get_text(llama.token_bos()),
+    )
+
+
+def tokenize_chat(llama: "Llama", messages: List[Dict[str, str]]) -> List[int]:
+    """Render messages with the model's own chat template and tokenize them"""
+    result = get_chat_formatter(llama)(messages=messages)
+    return llama.tokenize(result.prompt.encode("utf-8"), add_bos=not result.added_special, special=True)
+
+
+def add_to_batch(batch, token: int, pos: int, seq_ids: Sequence[int], logits: bool) -> None:
+    """Append one token to a llama_batch, shared by all given sequences"""
+    i = batch.n_tokens
+    batch.token[i] = token
+    batch.pos[i] = pos
+    batch.n_seq_id[i] = len(seq_ids)
+    for j, seq_id in enumerate(seq_ids):
+        batch.seq_id[i][j] = seq_id
+    batch.logits[i] = logits
+    batch.n_tokens += 1
+
+
+def batched_chat_completion(
+    llama: "Llama",
+    conversations: List[List[Dict[str, str]]],
+    n_ctx: int = 2048,
+    n_batch: int = 1024,
+    max_tokens: int = 1024,
+    temperature: float = 0.2,
+    top_p: float = 0.95,
+    top_k: int = 40,
+    seed: Optional[int] = None,
+    on_done: Optional[Callable[[int, str], None]] = None
+) -> List[str]:
+    """
+    Generate one answer per conversation with llama.cpp batched decoding
+
+    Every conversation gets its own sequence id inside the same llama_batch:
+    the prompts are prefilled together and each decode step advances all
+    unfinished sequences with a single forward pass, so the model weights are
+    read once per step for all of them. Tokens are sampled with temperature,
+    top-k and top-p (same defaults as create_chat_completion); temperature=0
+    picks them greedily.
+
+    The leading tokens all prompts have in common (usually the system prompt)
+    are prefilled only once and shared by every sequence in the KV cache.
+
+    A dedicated context is created for the call, with one unified KV cache
+    holding a sequence per conversation; n_ctx is shared by all sequences.
+    It uses the same KV cache types, flash attention and thread counts as
+    the llama instance (e.g. the q8_0 cache set up by get_llama).
+
+    Args:
+        llama: Loaded model (only its weights and tokenizer are used)
+        conversations: One list of chat messages per answer
+        n_ctx: Context size shared by all sequences
+        n_batch: Maximum number of tokens per decode call
+        max_tokens: Maximum number of generated tokens per sequence
+        temperature: Sampling temperature, 0 for greedy decoding
+        top_p: Keep the most likely tokens up to this cumulative probability
+        top_k: Keep at most this many candidate tokens (0 for all)
+        seed: Seed for the sampler (None for a random one)
+        on_done: Called with (index, answer) as soon as a conversation's answer is
+            complete, so callers can show answers before the slowest one is done
+
+    Returns:
+        The generated answers, in the order of the conversations
+    """
+    import llama_cpp
+    import numpy as np
+
+    n_seq = len(conversations)
+
+    ctx_params = llama_cpp.llama_context_default_params()
+    ctx_params.n_ctx = n_ctx
+    ctx_params.n_batch = n_batch
+    ctx_params.n_seq_max = n_seq
+    # Same KV cache types, attention kernel and threads as the model's own
+    # context (flash_attn became flash_attn_type in newer llama.cpp builds)
+    for name in ("type_k", "type_v", "flash_attn", "flash_attn_type", "n_threads", "n_threads_batch"):
+        if hasattr(ctx_params, name) and hasattr(llama.context_params, name):
+            setattr(ctx_params, name, getattr(llama.context_params, name))
+    # The shared prefix is decoded once for all sequences, which needs a single
+    # KV buffer for all of them; it also makes n_ctx the budget of all sequences
+    # together instead of n_ctx / n_seq each. Builds without this field always
+    # use a unified cache.
+    if hasattr(ctx_params, "kv_unified"):
+        ctx_params.kv_unified = True
+    ctx = llama_cpp.llama_new_context_with_model(llama.model, ctx_params)
+    if ctx is None:
+        raise RuntimeError("Failed to create batched context")
+
+    batch = llama_cpp.llama_batch_init(n_batch, 0, n_seq)
+    n_vocab = llama.n_vocab()
+    if hasattr(llama_cpp, "llama_model_get_vocab"):
+        vocab = llama_cpp.llama_model_get_vocab(llama.model)
+    else:
+        vocab = llama.model
+
+    rng = np.random.default_rng(seed)
+
+    def sample(i: int) -> int:
+        logits = np.ctypeslib.as_array(llama_cpp.llama_get_logits_ith(ctx, i), shape=(n_vocab,))
+        if temperature <= 0:
+            return int(np.argmax(logits))
+
+        k = min(top_k, n_vocab) if top_k > 0 else n_vocab
+        candidates = np.argpartition(logits, -k)[-k:]
+        scores = logits[candidates].astype(np.float64) / temperature
+        probs = np.exp(scores - scores.max())
+        probs /= probs.sum()
+
+        # Most likely candidates up to top_p (at least one)
+        order = np.argsort(-probs)
+        n_keep = int(np.searchsorted(np.cumsum(probs[order]), top_p)) + 1
+        keep = order[:n_keep]
+        return int(candidates[keep][rng.choice(n_keep, p=probs[keep] / probs[keep].sum())])
+
+    def decode() -> None:
+        if llama_cpp.llama_decode(ctx, batch) != 0:
+            raise RuntimeError("llama_decode failed")
+
+    try:
+        prompt_tokens = [tokenize_chat(llama, messages) for messages in conversations]
+
+        # Common prefix of all prompts; every prompt keeps at least its last
+        # token of its own, since that one produces the sequence's first logits
+        n_shared = 0
+        max_shared = min(len(tokens) for tokens in prompt_tokens) - 1
+        while n_shared < max_shared and all(
+            tokens[n_shared] == prompt_tokens[0][n_shared] for tokens in prompt_tokens
+        ):
+            n_shared += 1
+
+        used = n_shared + sum(len(tokens) - n_shared for tokens in prompt_tokens)
+        if used > n_ctx:
+            raise ValueError("Prompts do not fit into the context")
+
+        # Prefill: the shared prefix goes in once for all seq_ids, then the rest
+        # of every prompt under its own seq_id, all through the same batches.
+        # Only the last token of every prompt needs logits; the first answer
+        # token of a sequence is sampled right after its prompt is in.
+        all_seq_ids = tuple(range(n_seq))
+        items = [
+            (token, pos, all_seq_ids, False)
+            for pos, token in enumerate(prompt_tokens[0][:n_shared])
+        ] + [
+            (tokens[pos], pos, (seq_id,), pos == len(tokens) - 1)
+            for seq_id, tokens in enumerate(prompt_tokens)
+            for pos in range(n_shared, len(tokens))
+        ]
+        pending = {}
+        for start in range(0, len(items), n_batch):
+            batch.n_tokens = 0
+            for token, pos, seq_ids, last in items[start:start + n_batch]:
+                add_to_batch(batch, token, pos, seq_ids, last)
+            decode()
+            for i, (_, _, seq_ids, last) in enumerate(items[start:start + n_batch]):
+                if last:
+                    pending[seq_ids[0]] = sample(i)
+
+        positions = [len(tokens) for tokens in prompt_tokens]
+        outputs = [[] for _ in conversations]
+        answers = [None] * n_seq
+
+        def finish(seq_id: int) -> None:
+            answers[seq_id] = llama.detokenize(outputs[seq_id]).decode("utf-8", errors="ignore").strip()
+            if on_done:
+                on_done(seq_id, answers[seq_id])
+
+        # Decode: feed the last sampled token of every unfinished sequence in
+        # one batch, then sample the next token of each
+        while pending:
+            batch.n_tokens = 0
+            logits_index = {}
+            for seq_id, token in sorted(pending.items()):
+                if llama_cpp.llama_token_is_eog(vocab, token) or len(outputs[seq_id]) >= max_tokens:
+                    finish(seq_id)
+                    continue
+                outputs[seq_id].append(token)
+                logits_index[seq_id] = batch.n_tokens
+                add_to_batch(batch, token, positions[seq_id], (seq_id,), True)
+                positions[seq_id] += 1
+
+            if batch.n_tokens == 0 or used + batch.n_tokens > n_ctx:
+                break
+            used += batch.n_tokens
+            decode()
+            pending = {seq_id: sample(i) for seq_id, i in logits_index.items()}
+
+        # Sequences cut off by the context size
+        for seq_id in range(n_seq):
+            if answers[seq_id] is None:
+                finish(seq_id)
+
+        return answers
+    finally:
+        llama_cpp.llama_batch_free(batch)
+        llama_cpp.llama_free(ctx)
@@ -0,0 +1,161 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Union
+
+import orjson
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+
+# Cached responses live next to the examples, independent of the working directory
+CACHE_DIR = Path(__file__).parent.parent / ".llm_cache"
+MAX_CACHE_BYTES = 1 << 30  # 1 GB
+# Cached responses and saved prompt states (see prompt_state.py) share the size limit
+CACHE_PATTERNS = ("*.json", "*.state")
+
+
+def model_fingerprint(llama: "Llama") -> List[Any]:
+    """
+    Everything besides the request that a cached result depends on
+
+    The model file (path, size and modification time, so a re-downloaded file
+    is a different model), the llama_cpp version, the context size and the
+    KV cache types.
+    """
+    import llama_cpp
+
+    st = os.stat(llama.model_path)
+    return [
+        llama.model_path,
+        st.st_size,
+        st.st_mtime_ns,
+        llama_cpp.__version__,
+        llama.n_ctx(),
+        llama.context_params.type_k,
+        llama.context_params.type_v
+    ]
+
+
+def _cache_key(llama: "Llama", kwargs: Dict[str, Any]) -> str:
+    """Hash the model (see model_fingerprint) and every request argument into a file name"""
+    payload = orjson.dumps(
+        {"model": model_fingerprint(llama), **kwargs},
+        option=orjson.OPT_SORT_KEYS,
+        default=str
+    )
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _evict(cache_dir: Path, max_bytes: int) -> None:
+    """Delete least recently used entries until the cache fits into max_bytes"""
+    entries = [(entry.stat(), entry) for pattern in CACHE_PATTERNS for entry in cache_dir.glob(pattern)]
+    total = sum(st.st_size for st, _ in entries)
+    for st, entry in sorted(entries, key=lambda e: e[0].st_mtime):
+        if total <= max_bytes:
+            break
+        entry.unlink(missing_ok=True)
+        total -= st.st_size
+
+
+def trim_cache(cache_dir: Optional[Path] = None) -> None:
+    """Evict least recently used files until the cache fits into MAX_CACHE_BYTES"""
+    _evict(cache_dir or CACHE_DIR, MAX_CACHE_BYTES)
+
+
+def _store(response: Dict[str, Any], path: Path) -> None:
+    """Write a response to the cache and keep the cache within its size limit"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(orjson.dumps(response))
+    os.replace(tmp_path, path)
+    trim_cache(path.parent)
+
+
+def _replay(response: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Serve a cached response as a stream (a single chunk holding the whole message)"""
+    choice = response["choices"][0]
+    yield {
+        "id": response["id"],
+        "object": "chat.completion.chunk",
+        "created": response["created"],
+        "model": response["model"],
+        "choices": [{"index": 0, "delta": dict(choice["message"]), "finish_reason": choice["finish_reason"]}]
+    }
+
+
+def _stream_and_store(chunks: Iterator[Dict[str, Any]], path: Path) -> Iterator[Dict[str, Any]]:
+    """Pass streamed chunks through and cache the joined response once the stream is complete"""
+    parts = []
+    finish_reason = None
+    last = None
+    for chunk in chunks:
+        choice = chunk["choices"][0]
+        parts.append(choice["delta"].get("content") or "")
+        finish_reason = choice.get("finish_reason") or finish_reason
+        last = chunk
+        yield chunk
+
+    # Only reached if the caller consumed the whole stream
+    if last is not None:
+        _store({
+            "id": last["id"],
+            "object": "chat.completion",
+            "created": last["created"],
+            "model": last["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(parts)},
+                "logprobs": None,
+                "finish_reason": finish_reason
+            }]
+        }, path)
+
+
+def cached_chat_completion(
+    llama: "Llama",
+    cache_dir: Optional[Path] = None,
+    prepare: Optional[Callable[[], None]] = None,
+    **kwargs
+) -> Union[Dict[str, Any], Iterator[Dict[str, Any]]]:
+    """
+    Drop-in replacement for llama.create_chat_completion with a disk cache
+
+    Only deterministic requests are cached: temperature must be set to 0. The
+    cache key covers the model file and all request arguments (messages,
+    tools, sampler settings), so any change to them is a miss. The cache is
+    capped at MAX_CACHE_BYTES, evicting the least recently used responses
+    first.
+
+    With stream=True, a miss streams the model output as usual and caches the
+    joined response once the stream has been consumed; a hit is streamed as
+    a single chunk. Streamed and non-streamed requests share cache entries.
+
+    Args:
+        llama: The model to run on a cache miss
+        cache_dir: Directory for cached responses (default: .llm_cache in the repo root)
+        prepare: Optional callback run right before the model is used (i.e. not on a cache hit)
+        **kwargs: Arguments for create_chat_completion
+    """
+    stream = kwargs.pop("stream", False)
+    if kwargs.get("temperature") != 0:
+        if prepare:
+            prepare()
+        return llama.create_chat_completion(stream=stream, **kwargs)
+
+    cache_dir = cache_dir or CACHE_DIR
+    path = cache_dir / f"{_cache_key(llama, kwargs)}.json"
+
+    if path.exists():
+        os.utime(path)  # Mark as recently used
+        response = orjson.loads(path.read_bytes())
+        return _replay(response) if stream else response
+
+    if prepare:
+        prepare()
+    if stream:
+        return _stream_and_store(llama.create_chat_completion(stream=True, **kwargs), path)
+
+    response = llama.create_chat_completion(**kwargs)
+    _store(response, path)
+    return response
@@ -1,7 +1,8 @@
-import json
+import functools
+import orjson
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, TextIO, Tuple
 from enum import Enum
 
 
@@ -24,19 +25,43 @@ class PromptDebugger:
     def __init__(self, options: Optional[Dict[str, Any]] = None):
         options = options or {}
         self.output_dir = options.get('outputDir', './')
-        self.filename = options.get('filename', 'debug_output.txt')
+        # pretty=True writes the human-readable text format, otherwise one JSON object per line
+        self.pretty = options.get('pretty', False)
+        self.filename = options.get('filename', 'debug_output.txt' if self.pretty else 'debug_output.jsonl')
         self.include_timestamp = options.get('includeTimestamp', False)
         self.append_mode = options.get('appendMode', False)
         
+        # Open JSONL files, kept open for the lifetime of the debugger
+        self._handles: Dict[Path, TextIO] = {}
+        self._session_timestamp: Optional[str] = None
+        # Messages and text of the last _format_messages() call
+        self._last_formatted: Tuple[Tuple[Tuple[str, str], ...], str] = ((), "")
+        
         # Configure which outputs to include
         output_types = options.get('outputTypes', [OutputType.EXACT_PROMPT])
-        if not isinstance(output_types, list):
+        if not isinstance(output_types, (list, tuple, set, frozenset)):
             output_types = [output_types]
-        self.output_types = output_types
+        self.output_types = frozenset(output_types)
         
         # Ensure output directory exists
         Path(self.output_dir).mkdir(parents=True, exist_ok=True)
     
+    def __enter__(self) -> 'PromptDebugger':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+    
+    def close(self) -> None:
+        """Flush and close all open log files"""
+        for fh in self._handles.values():
+            fh.close()
+        self._handles.clear()
+    
+    def _now(self) -> str:
+        """Current time as ISO string"""
+        return datetime.now().isoformat()
+    
     def capture_exact_prompt(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """
         Captures the exact prompt (user input + system + functions)
@@ -52,11 +77,11 @@ class PromptDebugger:
         
         if functions:
             formatted_prompt += "\n\n=== Available Functions ===\n"
-            formatted_prompt += json.dumps(functions, indent=2)
+            formatted_prompt += orjson.dumps(functions, option=orjson.OPT_INDENT_2).decode('utf-8')
         
         return {
             'exactPrompt': formatted_prompt,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': self._now(),
             'messages': messages,
             'functions': functions
         }
@@ -70,16 +95,31 @@ class PromptDebugger:
         """
         return {
             'response': response,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': self._now()
         }
     
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _format_messages_cached(msg_tuple: Tuple[Tuple[str, str], ...]) -> str:
+        """Format (role, content) pairs for display"""
+        return "".join(f"\n=== {role.upper()} ===\n{content}\n" for role, content in msg_tuple)
+    
     def _format_messages(self, messages: List[Dict[str, str]]) -> str:
         """Format messages for display"""
-        formatted = ""
-        for msg in messages:
-            role = msg.get('role', 'unknown').upper()
-            content = msg.get('content', '')
-            formatted += f"\n=== {role} ===\n{content}\n"
+        msg_tuple = tuple(
+            (str(msg.get('role', 'unknown')), f"{msg.get('content', '')}")
+            for msg in messages
+        )
+        
+        # Conversations usually only grow at the end: reuse the text of the
+        # previous call and format just the new messages
+        last_tuple, last_formatted = self._last_formatted
+        if last_tuple and msg_tuple[:len(last_tuple)] == last_tuple:
+            formatted = last_formatted + self._format_messages_cached(msg_tuple[len(last_tuple):])
+        else:
+            formatted = self._format_messages_cached(msg_tuple)
+        
+        self._last_formatted = (msg_tuple, formatted)
         return formatted
     
     def capture_all(self, params: Dict[str, Any]) -> Dict[str, Any]:
@@ -89,17 +129,19 @@ class PromptDebugger:
         Args:
             params: Dictionary with 'messages', 'functions', 'response' (optional)
         """
+        # One timestamp for the whole event, shared by every captured part
+        ts = self._now()
         result = {
-            'timestamp': datetime.now().isoformat()
+            'timestamp': ts
         }
         
         if OutputType.EXACT_PROMPT in self.output_types:
             exact_data = self.capture_exact_prompt(params)
-            result.update(exact_data)
+            result.update({**exact_data, 'timestamp': ts})
         
         if 'response' in params:
             response_data = self.capture_response(params['response'])
-            result.update(response_data)
+            result.update({**response_data, 'timestamp': ts})
         
         return result
     
@@ -140,21 +182,36 @@ class PromptDebugger:
         Returns:
             Path to the saved file
         """
-        content = self.format_output(captured_data)
-        
         filename = custom_filename or self.filename
         
         if self.include_timestamp:
-            timestamp = datetime.now().isoformat().replace(':', '-').replace('.', '-')
+            if self.pretty:
+                timestamp = captured_data.get('timestamp') or self._now()
+            else:
+                # JSONL records carry their own timestamp, so one file per session is enough
+                if self._session_timestamp is None:
+                    self._session_timestamp = captured_data.get('timestamp') or self._now()
+                timestamp = self._session_timestamp
+            timestamp = timestamp.replace(':', '-').replace('.', '-')
             ext = Path(filename).suffix
             base = Path(filename).stem
             filename = f"{base}_{timestamp}{ext}"
         
         filepath = Path(self.output_dir) / filename
         
-        mode = 'a' if self.append_mode else 'w'
-        with open(filepath, mode, encoding='utf-8') as f:
-            f.write(content)
+        if self.pretty:
+            mode = 'a' if self.append_mode else 'w'
+            with open(filepath, mode, encoding='utf-8') as f:
+                f.write(self.format_output(captured_data))
+        else:
+            # appendMode only decides whether an existing file is kept when it is first
+            # opened; within one debugger every event is appended
+            fh = self._handles.get(filepath)
+            if fh is None:
+                mode = 'a' if self.append_mode else 'w'
+                fh = open(filepath, mode, encoding='utf-8', buffering=1 << 16)
+                self._handles[filepath] = fh
+            fh.write(orjson.dumps(captured_data, default=str).decode('utf-8') + "\n")
         
         print(f"Prompt debug output written to {filepath}")
         return str(filepath)
@@ -201,14 +258,14 @@ def debug_prompt(messages: List[Dict[str, str]], functions: Optional[List[Dict]]
         response: Optional model response
         options: Optional debugger options
     """
-    debugger = PromptDebugger(options)
     params = {
         'messages': messages,
         'functions': functions or [],
     }
     if response:
         params['response'] = response
-    return debugger.debug(params)
+    with PromptDebugger(options) as debugger:
+        return debugger.debug(params)
 
 
 def log_prompt(messages: List[Dict[str, str]], functions: Optional[List[Dict]] = None,
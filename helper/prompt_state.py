@@ -0,0 +1,157 @@
+import ctypes
+import hashlib
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+import orjson
+
+from helper.batched_decoding import get_chat_formatter
+from helper.llm_cache import CACHE_DIR, model_fingerprint, trim_cache
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+
+# Prefix tokens by state key, so each prefix is tokenized at most once per process
+_prefix_tokens: Dict[str, List[int]] = {}
+
+
+def render_prefix(
+    llama: "Llama",
+    system_prompt: str,
+    tools: Optional[Sequence[Dict[str, Any]]] = None
+) -> Tuple[bytes, bool, bytes]:
+    """
+    Render the part of a chat that every request shares
+
+    The chat template renders the system prompt (and the tool definitions)
+    before any user message. Rendering a conversation with and without a
+    user turn and taking the common text gives exactly that static prefix.
+    Templates may render more than the messages into it (gpt-oss adds the
+    current date), so the prefix can change even if the system prompt doesn't.
+
+    Returns (prefix text, add_bos, full text of the conversation with a user turn).
+    """
+    formatter = get_chat_formatter(llama)
+    tool_args = {"tools": list(tools), "tool_choice": "auto"} if tools else {}
+    system = {"role": "system", "content": system_prompt}
+    system_only = formatter(messages=[system], **tool_args)
+    with_user = formatter(messages=[system, {"role": "user", "content": "?"}], **tool_args)
+
+    prefix = os.path.commonprefix([system_only.prompt, with_user.prompt]).encode("utf-8")
+    return prefix, not with_user.added_special, with_user.prompt.encode("utf-8")
+
+
+def system_prefix(
+    llama: "Llama",
+    system_prompt: str,
+    tools: Optional[Sequence[Dict[str, Any]]] = None
+) -> Tuple[bytes, List[int], bool, bool]:
+    """
+    Render and tokenize the part of a chat that every request shares
+
+    Returns (prefix text, prefix tokens, add_bos, splice_ok). splice_ok says
+    whether tokenizing the prefix separately yields the same tokens as
+    tokenizing a whole prompt, i.e. whether the tokens can be reused.
+    """
+    prefix, add_bos, full = render_prefix(llama, system_prompt, tools)
+    tokens = llama.tokenize(prefix, add_bos=add_bos, special=True)
+
+    rest = llama.tokenize(full[len(prefix):], add_bos=False, special=True)
+    splice_ok = tokens + rest == llama.tokenize(full, add_bos=add_bos, special=True)
+
+    return prefix, tokens, add_bos, splice_ok
+
+
+def reuse_prefix_tokens(
+    llama: "Llama",
+    system_prompt: str,
+    tools: Optional[Sequence[Dict[str, Any]]] = None
+) -> None:
+    """
+    Make llama.tokenize reuse the precomputed tokens of the static prefix
+
+    The chat handler tokenizes the whole rendered prompt on every call. After
+    this, prompts starting with the static prefix only have the rest
+    tokenized, so a long system prompt or tools schema is tokenized once.
+    Nothing is changed if splicing the tokens would not be exact.
+    """
+    prefix, prefix_tokens, prefix_add_bos, splice_ok = system_prefix(llama, system_prompt, tools)
+    if not splice_ok:
+        return
+
+    tokenize = llama.tokenize
+
+    def tokenize_with_static_prefix(text: bytes, add_bos: bool = True, special: bool = False) -> List[int]:
+        if special and add_bos == prefix_add_bos and text.startswith(prefix):
+            return prefix_tokens + tokenize(text[len(prefix):], add_bos=False, special=True)
+        return tokenize(text, add_bos=add_bos, special=special)
+
+    llama.tokenize = tokenize_with_static_prefix
+
+
+def load_system_prompt_state(
+    llama: "Llama",
+    system_prompt: str,
+    cache_dir: Optional[Path] = None,
+    tools: Optional[Sequence[Dict[str, Any]]] = None
+) -> None:
+    """
+    Put the model into the state right after evaluating the system prompt
+
+    If the context already starts with the system prompt prefix, nothing
+    needs to happen: create_chat_completion reuses the longest matching
+    prefix by itself. Otherwise the prefix is restored from a llama.cpp state
+    file (tokens + KV cache), or, on the first run, evaluated and saved to
+    one. Either way the next chat completion only evaluates the tokens after
+    the prefix.
+
+    State files are keyed by the model file, llama_cpp version, context
+    settings and the rendered prefix (not just the system prompt and tools,
+    since the template can render more into it), and count towards the size
+    limit of the response cache they are stored next to.
+
+    Args:
+        llama: The model
+        system_prompt: System message every request starts with
+        cache_dir: Directory for state files (default: .llm_cache in the repo root)
+        tools: Tool definitions every request is sent with
+    """
+    import llama_cpp
+
+    prefix, add_bos, _ = render_prefix(llama, system_prompt, tools)
+    key = hashlib.sha256(orjson.dumps([*model_fingerprint(llama), prefix.decode("utf-8")])).hexdigest()
+
+    tokens = _prefix_tokens.get(key)
+    if tokens is not None and llama.n_tokens >= len(tokens) and llama.input_ids[:len(tokens)].tolist() == tokens:
+        return
+
+    cache_dir = cache_dir or CACHE_DIR
+    path = cache_dir / f"{key}.state"
+
+    if path.exists():
+        buffer = (llama_cpp.llama_token * llama.n_ctx())()
+        n_loaded = ctypes.c_size_t(0)
+        if llama_cpp.llama_state_load_file(
+            llama.ctx, str(path).encode("utf-8"), buffer, llama.n_ctx(), ctypes.byref(n_loaded)
+        ):
+            tokens = buffer[:n_loaded.value]
+            llama.input_ids[:len(tokens)] = tokens
+            llama.n_tokens = len(tokens)
+            _prefix_tokens[key] = tokens
+            os.utime(path)  # Mark as recently used
+            return
+
+    tokens = llama.tokenize(prefix, add_bos=add_bos, special=True)
+    llama.reset()
+    llama.eval(tokens)
+    _prefix_tokens[key] = tokens
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    token_array = (llama_cpp.llama_token * len(tokens))(*tokens)
+    if llama_cpp.llama_state_save_file(llama.ctx, str(tmp_path).encode("utf-8"), token_array, len(tokens)):
+        os.replace(tmp_path, path)
+        trim_cache(cache_dir)
+    else:
+        tmp_path.unlink(missing_ok=True)
@@ -0,0 +1,46 @@
+import sys
+import time
+from typing import List, Optional, TextIO
+
+
+class StreamBuffer:
+    """
+    Helper class for printing streamed LLM output
+
+    Printing and flushing every streamed token costs a Python-level write per
+    chunk. This buffer collects chunks and writes them out once `size`
+    characters are pending or `interval_ms` has passed since the last write.
+    It also keeps every chunk so the full response can be joined once at the
+    end instead of growing a string with += on each token.
+    """
+
+    def __init__(self, size: int = 8192, interval_ms: int = 25, stream: Optional[TextIO] = None):
+        self.size = size
+        self.interval = interval_ms / 1000
+        self.stream = stream or sys.stdout
+        self._buf: List[str] = []
+        self._buf_len = 0
+        self._all: List[str] = []
+        self._last_flush = time.monotonic()
+
+    def add(self, content: str) -> None:
+        """Add a chunk and write out pending output if size or interval is reached"""
+        self._buf.append(content)
+        self._all.append(content)
+        self._buf_len += len(content)
+
+        if self._buf_len >= self.size or time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write out all pending chunks"""
+        if self._buf:
+            self.stream.write("".join(self._buf))
+            self.stream.flush()
+            self._buf.clear()
+            self._buf_len = 0
+        self._last_flush = time.monotonic()
+
+    def text(self) -> str:
+        """Get everything added so far as one string"""
+        return "".join(self._all)
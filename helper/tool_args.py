@@ -0,0 +1,129 @@
+import functools
+import re
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import json5
+import orjson
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama, LlamaGrammar
+
+# Tool calls as Qwen3's chat template asks the model to write them
+TOOL_CALL_PATTERN = re.compile(r'<tool_call>\s*(.*?)\s*</tool_call>', re.DOTALL)
+TOOL_NAME_PATTERN = re.compile(r'"name"\s*:\s*"([^"]+)"')
+
+
+def parse_tool_arguments(arguments: Optional[Union[str, Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Parse the arguments of a model-generated tool call
+
+    Empty arguments become an empty dict. Arguments that don't end with a
+    closing bracket are incomplete (e.g. the model hit max_tokens) and are not
+    parsed at all. Valid JSON goes through orjson, which parses faster than
+    the stdlib; only if that fails is JSON5 used, which accepts common model
+    slips like trailing commas or single quotes.
+
+    Args:
+        arguments: The tool call's "arguments" field
+    """
+    if isinstance(arguments, dict):
+        return arguments
+
+    args_str = arguments or "{}"
+    if args_str.rstrip()[-1:] not in ("}", "]"):
+        return {}
+
+    try:
+        return orjson.loads(args_str)
+    except orjson.JSONDecodeError:
+        return json5.loads(args_str)
+
+
+def split_tool_calls(content: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Separate the tool calls a model wrote as text from the rest of its answer
+
+    llama-cpp-python's handler for the model's own chat template only returns
+    "tool_calls" when tool_choice forces a function. With tool_choice="auto",
+    Qwen3's calls stay in the content as <tool_call>{"name": ..., "arguments": ...}</tool_call>
+    blocks; they are returned here in the OpenAI format instead. A call whose
+    JSON can't be parsed keeps its name and gets empty arguments, so
+    resolve_tool_arguments can generate them again.
+
+    Args:
+        content: The assistant message's content
+
+    Returns:
+        The content without the tool call blocks, and the tool calls
+    """
+    tool_calls = []
+    for block in TOOL_CALL_PATTERN.findall(content):
+        try:
+            call = parse_tool_arguments(block)
+        except ValueError:
+            match = TOOL_NAME_PATTERN.search(block)
+            call = {"name": match.group(1), "arguments": {}} if match else {}
+        if not call.get("name"):
+            continue
+
+        arguments = call.get("arguments") or {}
+        tool_calls.append({
+            "id": f"call_{len(tool_calls)}",
+            "type": "function",
+            "function": {
+                "name": call["name"],
+                "arguments": arguments if isinstance(arguments, str) else orjson.dumps(arguments).decode("utf-8")
+            }
+        })
+
+    return TOOL_CALL_PATTERN.sub("", content).strip(), tool_calls
+
+
+@functools.lru_cache(maxsize=None)
+def load_grammar(gbnf: str) -> "LlamaGrammar":
+    """Compile a GBNF grammar once per process"""
+    from llama_cpp import LlamaGrammar
+
+    return LlamaGrammar.from_string(gbnf, verbose=False)
+
+
+def resolve_tool_arguments(
+    llama: "Llama",
+    messages: List[Dict[str, Any]],
+    tool_call: Dict[str, Any],
+    functions: Sequence[Dict[str, Any]],
+    grammars: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """
+    Get usable arguments for a tool call, regenerating them under a grammar if needed
+
+    The arguments the model wrote are kept if they parse and contain every
+    required parameter. Otherwise, if a GBNF grammar is given for the
+    function, they are generated once more with grammar-constrained sampling:
+    only tokens the grammar allows can be picked, so the result is always
+    valid JSON of the expected shape and no retry loop is needed.
+
+    Args:
+        llama: The model that made the tool call
+        messages: The conversation up to (not including) the tool call
+        tool_call: One entry of the assistant message's "tool_calls"
+        functions: The function definitions passed as tools
+        grammars: GBNF grammar for the arguments, by function name
+    """
+    name = tool_call["function"]["name"]
+    try:
+        arguments = parse_tool_arguments(tool_call["function"]["arguments"])
+    except ValueError:
+        arguments = {}
+
+    function = next((f for f in functions if f["name"] == name), None)
+    required = function["parameters"].get("required", []) if function else []
+    if all(key in arguments for key in required) or name not in (grammars or {}):
+        return arguments
+
+    response = llama.create_chat_completion(
+        messages=messages + [{"role": "user", "content": f"Write the arguments for {name} as JSON."}],
+        grammar=load_grammar(grammars[name]),
+        temperature=0
+    )
+    return orjson.loads(response["choices"][0]["message"]["content"])
@@ -1,26 +1,39 @@
-from llama_cpp import Llama
 import os
 from pathlib import Path
 
 # Get the directory of the current file
 current_dir = Path(__file__).parent
 
-# Initialize and load the model
-llama = Llama(
-    model_path=str(current_dir / ".." / "models" / "Qwen3-1.7B-Q8_0.gguf"),
-    n_ctx=2048,  # context size
-    verbose=False
-)
-
-prompt = "do you know node-llama-cpp"
-
-# Create chat completion
-response = llama.create_chat_completion(
-    messages=[
-        {"role": "user", "content": prompt}
-    ]
-)
-
-# Extract and print the response
-answer = response["choices"][0]["message"]["content"]
-print(f"AI: {answer}")
+
+def main():
+    # Imported here: loading the native llama.cpp library is only worth it when the example runs
+    from llama_cpp import Llama
+
+    # Initialize and load the model
+    # Q4_K_M weights are half the size of Q8_0, so each generated token reads half the bytes
+    llama = Llama(
+        model_path=str(current_dir / ".." / "models" / "Qwen3-1.7B-Q4_K_M.gguf"),
+        n_ctx=int(os.getenv("N_CTX", "512")),  # context size; the KV cache is allocated for all of it upfront
+        n_gpu_layers=int(os.getenv("N_GPU_LAYERS", "-1")),  # All layers on the GPU (no effect on CPU-only builds)
+        verbose=False
+    )
+
+    # /no_think switches off Qwen3's thinking mode: without max_tokens the answer
+    # only gets what is left of the 512-token context, and a <think> block could
+    # use all of it before the answer starts
+    prompt = "do you know node-llama-cpp /no_think"
+
+    # Create chat completion
+    response = llama.create_chat_completion(
+        messages=[
+            {"role": "user", "content": prompt}
+        ]
+    )
+
+    # Extract and print the response
+    answer = response["choices"][0]["message"]["content"]
+    print(f"AI: {answer}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
+import asyncio
+import httpx
 import os
 from dotenv import load_dotenv
 
@@ -7,23 +9,32 @@ load_dotenv()
 
 # Initialize OpenAI client
 # Create an API key at https://platform.openai.com/api-keys
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# The async client lets independent requests run concurrently.
+# HTTP/2 multiplexes those requests over one kept-alive connection, so only
+# the first one pays for the TLS handshake.
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        timeout=httpx.Timeout(60, connect=5),
+    ),
+)
 
 print("=== OpenAI Intro: Understanding the Basics ===\n")
 
 # ============================================
 # EXAMPLE 1: Basic Chat Completion
 # ============================================
-def basic_completion():
-    print("--- Example 1: Basic Chat Completion ---")
-
-    response = client.chat.completions.create(
+async def basic_completion():
+    response = await client.chat.completions.create(
         model='gpt-4o',
         messages=[
             {'role': 'user', 'content': 'What is llama-cpp-python?'}
         ],
     )
 
+    print("--- Example 1: Basic Chat Completion ---")
     print(f"AI: {response.choices[0].message.content}")
     print("\n")
 
@@ -31,10 +42,8 @@ def basic_completion():
 # ============================================
 # EXAMPLE 2: Using System Prompts
 # ============================================
-def system_prompt_example():
-    print("--- Example 2: System Prompts (Behavioral Control) ---")
-
-    response = client.chat.completions.create(
+async def system_prompt_example():
+    response = await client.chat.completions.create(
         model='gpt-4o',
         messages=[
             {'role': 'system', 'content': 'You are a coding assistant that talks like a pirate.'},
@@ -42,6 +51,7 @@ def system_prompt_example():
         ],
     )
 
+    print("--- Example 2: System Prompts (Behavioral Control) ---")
     print(f"AI: {response.choices[0].message.content}")
     print("\n")
 
@@ -49,25 +59,26 @@ def system_prompt_example():
 # ============================================
 # EXAMPLE 3: Temperature and Creativity
 # ============================================
-def temperature_example():
-    print("--- Example 3: Temperature Control ---")
-
+async def temperature_example():
     prompt = "Write a one-sentence tagline for a coffee shop."
 
-    # Low temperature = more focused and deterministic
-    focused_response = client.chat.completions.create(
-        model='gpt-4o',
-        messages=[{'role': 'user', 'content': prompt}],
-        temperature=0.2,
-    )
-
-    # High temperature = more creative and varied
-    creative_response = client.chat.completions.create(
-        model='gpt-4o',
-        messages=[{'role': 'user', 'content': prompt}],
-        temperature=1.5,
+    # Both requests are independent, so send them at the same time
+    focused_response, creative_response = await asyncio.gather(
+        # Low temperature = more focused and deterministic
+        client.chat.completions.create(
+            model='gpt-4o',
+            messages=[{'role': 'user', 'content': prompt}],
+            temperature=0.2,
+        ),
+        # High temperature = more creative and varied
+        client.chat.completions.create(
+            model='gpt-4o',
+            messages=[{'role': 'user', 'content': prompt}],
+            temperature=1.5,
+        ),
     )
 
+    print("--- Example 3: Temperature Control ---")
     print(f"Low temp (0.2): {focused_response.choices[0].message.content}")
     print(f"High temp (1.5): {creative_response.choices[0].message.content}")
     print("\n")
@@ -76,9 +87,7 @@ def temperature_example():
 # ============================================
 # EXAMPLE 4: Conversation with Context
 # ============================================
-def conversation_context():
-    print("--- Example 4: Multi-turn Conversation ---")
-
+async def conversation_context():
     # Build conversation history
     messages = [
         {'role': 'system', 'content': 'You are a helpful coding tutor.'},
@@ -86,27 +95,27 @@ def conversation_context():
     ]
 
     # First response
-    response1 = client.chat.completions.create(
+    response1 = await client.chat.completions.create(
         model='gpt-4o',
         messages=messages,
         max_tokens=150,
     )
 
-    print("User: What is a coroutine in Python?")
-    print(f"AI: {response1.choices[0].message.content}")
-
     # Add AI response to history
     messages.append(response1.choices[0].message)
 
     # Add follow-up question
     messages.append({'role': 'user', 'content': 'Can you show me a simple example?'})
 
-    # Second response (with context)
-    response2 = client.chat.completions.create(
+    # Second response (with context) - depends on the first, so it stays sequential
+    response2 = await client.chat.completions.create(
         model='gpt-4o',
         messages=messages,
     )
 
+    print("--- Example 4: Multi-turn Conversation ---")
+    print("User: What is a coroutine in Python?")
+    print(f"AI: {response1.choices[0].message.content}")
     print("\nUser: Can you show me a simple example?")
     print(f"AI: {response2.choices[0].message.content}")
     print("\n")
@@ -115,11 +124,11 @@ def conversation_context():
 # ============================================
 # EXAMPLE 5: Streaming Responses
 # ============================================
-def streaming_example():
+async def streaming_example():
     print("--- Example 5: Streaming Response ---")
     print("AI: ", end="")
 
-    stream = client.chat.completions.create(
+    stream = await client.chat.completions.create(
         model='gpt-4o',
         messages=[
             {'role': 'user', 'content': 'Write a haiku about programming.'}
@@ -127,7 +136,7 @@ def streaming_example():
         stream=True,
     )
 
-    for chunk in stream:
+    async for chunk in stream:
         if chunk.choices[0].delta.content:
             print(chunk.choices[0].delta.content, end="", flush=True)
 
@@ -137,10 +146,8 @@ def streaming_example():
 # ============================================
 # EXAMPLE 6: Token Usage and Limits
 # ============================================
-def token_usage_example():
-    print("--- Example 6: Understanding Token Usage ---")
-
-    response = client.chat.completions.create(
+async def token_usage_example():
+    response = await client.chat.completions.create(
         model='gpt-4o',
         messages=[
             {'role': 'user', 'content': 'Explain recursion in 3 sentences.'}
@@ -148,34 +155,38 @@ def token_usage_example():
         max_tokens=100,
     )
 
+    print("--- Example 6: Understanding Token Usage ---")
     print(f"AI: {response.choices[0].message.content}")
     print("\nToken usage:")
     print(f"- Prompt tokens: {response.usage.prompt_tokens}")
     print(f"- Completion tokens: {response.usage.completion_tokens}")
     print(f"- Total tokens: {response.usage.total_tokens}")
+    # Prompt prefixes of 1024+ tokens are cached automatically; this shows how many were reused
+    details = response.usage.prompt_tokens_details
+    print(f"- Cached prompt tokens: {details.cached_tokens if details else 0}")
     print("\n")
 
 
 # ============================================
 # EXAMPLE 7: Model Comparison
 # ============================================
-def model_comparison():
-    print("--- Example 7: Different Models ---")
-
+async def model_comparison():
     prompt = "What's 25 * 47?"
 
-    # GPT-4o - Most capable
-    gpt4_response = client.chat.completions.create(
-        model='gpt-4o',
-        messages=[{'role': 'user', 'content': prompt}],
-    )
-
-    # GPT-3.5-turbo - Faster and cheaper
-    gpt35_response = client.chat.completions.create(
-        model='gpt-3.5-turbo',
-        messages=[{'role': 'user', 'content': prompt}],
+    gpt4_response, gpt35_response = await asyncio.gather(
+        # GPT-4o - Most capable
+        client.chat.completions.create(
+            model='gpt-4o',
+            messages=[{'role': 'user', 'content': prompt}],
+        ),
+        # GPT-3.5-turbo - Faster and cheaper
+        client.chat.completions.create(
+            model='gpt-3.5-turbo',
+            messages=[{'role': 'user', 'content': prompt}],
+        ),
     )
 
+    print("--- Example 7: Different Models ---")
     print(f"GPT-4o: {gpt4_response.choices[0].message.content}")
     print(f"GPT-3.5-turbo: {gpt35_response.choices[0].message.content}")
     print("\n")
@@ -184,15 +195,22 @@ def model_comparison():
 # ============================================
 # Run all examples
 # ============================================
-def main():
+async def main():
     try:
-        basic_completion()
-        system_prompt_example()
-        temperature_example()
-        conversation_context()
-        streaming_example()
-        token_usage_example()
-        model_comparison()
+        # The examples don't depend on each other, so their requests run
+        # concurrently. Each example prints its whole output at once after its
+        # responses arrived, so the sections may appear in any order.
+        await asyncio.gather(
+            basic_completion(),
+            system_prompt_example(),
+            temperature_example(),
+            conversation_context(),
+            token_usage_example(),
+            model_comparison(),
+        )
+
+        # Streaming prints while the response arrives, so it runs on its own
+        await streaming_example()
 
         print("=== All examples completed! ===")
     except Exception as error:
@@ -202,4 +220,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
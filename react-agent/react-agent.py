@@ -1,22 +1,19 @@
-from llama_cpp import Llama
 from pathlib import Path
+import functools
 import json
 import sys
 
-# Add parent directory to path
-sys.path.append(str(Path(__file__).parent.parent))
+# Make the helper package importable (only once, even if several scripts share a process)
+root_dir = str(Path(__file__).resolve().parent.parent)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+from helper.model_loader import gpu_layers
 from helper.prompt_debugger import PromptDebugger
+from helper.prompt_state import load_system_prompt_state, reuse_prefix_tokens
 
 # Get the directory of the current file
 current_dir = Path(__file__).parent
 
-# Initialize and load the model
-llama = Llama(
-    model_path=str(current_dir / ".." / "models" / "hf_giladgd_gpt-oss-20b.MXFP4.gguf"),
-    n_ctx=2000,
-    verbose=False
-)
-
 # ReAct-style system prompt for mathematical reasoning
 system_prompt = """You are a mathematical assistant that uses the ReAct (Reasoning + Acting) approach.
 
@@ -157,73 +154,77 @@ def execute_function_call(function_name: str, arguments: dict) -> str:
         return f"Error: Unknown function {function_name}"
 
 
+@functools.cache
+def get_model():
+    """Load the model on first use and set up prompt reuse for it"""
+    from llama_cpp import Llama
+
+    llama = Llama(
+        model_path=str(current_dir / ".." / "models" / "hf_giladgd_gpt-oss-20b.MXFP4.gguf"),
+        n_ctx=2000,  # KV cache memory grows linearly with this; shrink it if the conversations stay short
+        n_gpu_layers=gpu_layers(),
+        verbose=False
+    )
+
+    # The chat handler tokenizes the whole rendered prompt on every call; reuse
+    # the tokens of the static prefix so the tools schema is tokenized only once
+    reuse_prefix_tokens(llama, system_prompt, functions)
+    return llama
+
+
 def react_agent(user_prompt: str, max_iterations: int = 10) -> str:
     """ReAct Agent execution loop with proper output handling"""
     print("\n" + "=" * 70)
     print(f"USER QUESTION: {user_prompt}")
     print("=" * 70 + "\n")
     
+    llama = get_model()
+    load_system_prompt_state(llama, system_prompt, tools=functions)
+    
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt}
     ]
     
     iteration = 0
-    full_response = ""
+    full_response_chunks = []
     
     while iteration < max_iterations:
         iteration += 1
         print(f"--- Iteration {iteration} ---")
         
-        # Get response from model
+        # Get response from model (non-streaming, so tool calls are kept)
         response = llama.create_chat_completion(
             messages=messages,
             tools=functions,
             tool_choice="auto",
             max_tokens=300,
-            stream=True
+            # One reasoning step per call: stop before the model invents an
+            # observation or starts the next thought on its own
+            stop=["\nObservation:", "\nThought:"]
         )
         
-        # Collect streaming response
-        current_chunk = ""
-        for chunk in response:
-            if "choices" in chunk and len(chunk["choices"]) > 0:
-                delta = chunk["choices"][0].get("delta", {})
-                if "content" in delta and delta["content"]:
-                    content = delta["content"]
-                    print(content, end="", flush=True)
-                    current_chunk += content
-        
-        print()  # New line after streaming
-        
-        full_response += current_chunk
+        message = response["choices"][0]["message"]
+        current_chunk = message.get("content") or ""
+        print(current_chunk)
         
-        # Add assistant message
-        messages.append({"role": "assistant", "content": current_chunk})
+        full_response_chunks.append(current_chunk)
         
         # Check if we have a final answer
         if "answer:" in current_chunk.lower():
+            messages.append({"role": "assistant", "content": current_chunk})
             print("\n" + "=" * 70)
             print("FINAL ANSWER REACHED")
             print("=" * 70)
-            return full_response
+            return "".join(full_response_chunks)
         
-        # Check if model wants to call functions (re-query without streaming to get tool calls)
-        check_response = llama.create_chat_completion(
-            messages=messages,
-            tools=functions,
-            tool_choice="auto",
-            max_tokens=1
-        )
-        
-        check_message = check_response["choices"][0]["message"]
-        
-        if "tool_calls" in check_message and check_message["tool_calls"]:
-            # Update the last message with tool calls
-            messages[-1] = check_message
+        # Check if model wants to call functions
+        if "tool_calls" in message and message["tool_calls"]:
+            # Add assistant message with tool calls
+            messages.append(message)
             
             # Execute tool calls
-            for tool_call in check_message["tool_calls"]:
+            for tool_call in message["tool_calls"]:
                 function_name = tool_call["function"]["name"]
                 function_args = json.loads(tool_call["function"]["arguments"]) if tool_call["function"]["arguments"] else {}
                 
@@ -238,34 +239,37 @@ def react_agent(user_prompt: str, max_iterations: int = 10) -> str:
                 })
         else:
             # No tool calls, prompt for continuation
+            messages.append({"role": "assistant", "content": current_chunk})
             messages.append({
                 "role": "user",
                 "content": "Continue your reasoning. What's the next step?"
             })
     
     print("\n⚠️  Max iterations reached without final answer")
-    return full_response or "Could not complete reasoning within iteration limit."
+    return "".join(full_response_chunks) or "Could not complete reasoning within iteration limit."
 
 
-# Test queries that require multi-step reasoning
-queries = [
-    "A store sells 15 items on Monday at $8 each, 20 items on Tuesday at $8 each, and 10 items on Wednesday at $8 each. What's the average number of items sold per day, and what's the total revenue?",
-]
+if __name__ == "__main__":
+    # Test queries that require multi-step reasoning
+    queries = [
+        "A store sells 15 items on Monday at $8 each, 20 items on Tuesday at $8 each, and 10 items on Wednesday at $8 each. What's the average number of items sold per day, and what's the total revenue?",
+    ]
 
-for query in queries:
-    react_agent(query, max_iterations=15)
-    print("\n")
+    for query in queries:
+        react_agent(query, max_iterations=15)
+        print("\n")
 
-# Debug
-prompt_debugger = PromptDebugger({
-    'outputDir': './logs',
-    'filename': 'react_calculator.txt',
-    'includeTimestamp': True,
-    'appendMode': False
-})
+    # Debug
+    prompt_debugger = PromptDebugger({
+        'outputDir': './logs',
+        'filename': 'react_calculator.jsonl',
+        'includeTimestamp': True,
+        'appendMode': False
+    })
 
-# Note: This will log the final state of messages
-# prompt_debugger.debug({
-#     'messages': messages,
-#     'functions': functions
-# })
+    # Note: This will log the final state of messages
+    # prompt_debugger.debug({
+    #     'messages': messages,
+    #     'functions': functions
+    # })
+    # prompt_debugger.close()
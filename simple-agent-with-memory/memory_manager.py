@@ -1,61 +1,186 @@
-import json
+import hashlib
+import orjson
+import os
+import re
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+
+# Words too common to tell memories apart when searching
+STOPWORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'do', 'does', 'for', 'from', 'have',
+    'how', 'i', 'in', 'is', 'it', 'me', 'my', 'of', 'on', 'or', 'the', 'to', 'user',
+    'was', 'what', 'when', 'where', 'which', 'who', 'why', 'with', 'you', 'your'
+})
 
 
 class MemoryManager:
     """Manages persistent memory for AI agents"""
     
-    def __init__(self, memory_file_path: str = './memory.json'):
+    def __init__(self, memory_file_path: str = './memory.json', max_facts: int = 50):
         self.memory_file_path = Path(memory_file_path)
+        self.max_facts = max_facts
+        # (file version, parsed memories) of the last read or write
+        self._cache: Optional[Tuple[Tuple[int, int, int], Dict[str, Any]]] = None
+    
+    @staticmethod
+    def _file_version(st: os.stat_result) -> Tuple[int, int, int]:
+        """Identify a file state; os.replace() swaps in a new inode on every save"""
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+    
+    @staticmethod
+    def _empty_memories() -> Dict[str, Any]:
+        """Memory structure used when nothing has been saved yet"""
+        return {
+            'facts': [],
+            'preferences': {},
+            'conversations': []
+        }
     
     def load_memories(self) -> Dict[str, Any]:
-        """Load memories from the JSON file"""
+        """
+        Load memories from the JSON file (re-parsed only when the file changed)
+        
+        The returned dict is the cached one: build a new dict to change
+        memories, so the cache only changes once save_memories succeeded.
+        """
+        if not self.memory_file_path.exists():
+            return self._empty_memories()
+        
+        version = self._file_version(self.memory_file_path.stat())
+        if self._cache is not None and self._cache[0] == version:
+            return self._cache[1]
+        
+        with open(self.memory_file_path, 'rb') as f:
+            # Version of the file actually opened, in case it was replaced since stat()
+            version = self._file_version(os.fstat(f.fileno()))
+            data = f.read()
+        
         try:
-            with open(self.memory_file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            # If file doesn't exist or is invalid, return empty memory
-            return {
-                'facts': [],
-                'preferences': {},
-                'conversations': []
-            }
+            memories = orjson.loads(data)
+        except orjson.JSONDecodeError as error:
+            # Keep a copy of the broken file instead of silently losing it on the next save
+            timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            backup_path = self.memory_file_path.with_name(f"{self.memory_file_path.name}.corrupt-{timestamp}")
+            backup_path.write_bytes(data)
+            print(f"Warning: {self.memory_file_path} is not valid JSON ({error}), backed up to {backup_path}")
+            memories = self._empty_memories()
+        
+        self._cache = (version, memories)
+        return memories
     
     def save_memories(self, memories: Dict[str, Any]) -> None:
         """Save new memories to the JSON file"""
-        with open(self.memory_file_path, 'w', encoding='utf-8') as f:
-            json.dump(memories, f, indent=2, ensure_ascii=False)
+        # Write a fully synced temp file and atomically swap it in, so concurrent
+        # readers see either the old or the new file, never a half-written one.
+        # Sorted keys make the content (and its hash) independent of insertion order.
+        tmp_path = self.memory_file_path.with_name(self.memory_file_path.name + '.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(memories, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.memory_file_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        self._cache = (self._file_version(self.memory_file_path.stat()), memories)
     
     def add_fact(self, fact: str) -> None:
         """Add a specific fact"""
         memories = self.load_memories()
-        memories['facts'].append({
+        fact = {
             'content': fact,
             'timestamp': datetime.now().isoformat()
-        })
-        self.save_memories(memories)
+        }
+        self.save_memories({**memories, 'facts': memories['facts'] + [fact]})
     
     def add_preference(self, key: str, value: str) -> None:
         """Add a user preference"""
         memories = self.load_memories()
-        memories['preferences'][key] = value
-        self.save_memories(memories)
+        self.save_memories({**memories, 'preferences': {**memories['preferences'], key: value}})
     
-    def get_memory_summary(self) -> str:
-        """Get a summary of all memories for the system prompt"""
+    def get_top_k_by_recency_and_importance(self, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get the k most relevant facts: highest importance first, newest first within the same importance"""
+        return self._rank_facts(self.load_memories()['facts'], k)
+    
+    def _rank_facts(self, facts: List[Dict[str, Any]], k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Sort facts by importance and recency and keep the first k"""
+        k = self.max_facts if k is None else k
+        ranked = sorted(
+            facts,
+            key=lambda f: (f.get('importance', 0), f.get('timestamp', '')),
+            reverse=True
+        )
+        return ranked[:k]
+    
+    @staticmethod
+    def _words(text: str) -> set:
+        """
+        Lowercase words of a text, splitting keys like 'favorite_food' too
+        
+        Single characters (like the 's' of "what's") and stopwords are dropped,
+        so they don't make every question match every memory.
+        """
+        return {
+            word for word in re.findall(r'[a-z0-9]+', text.lower())
+            if len(word) > 1 and word not in STOPWORDS
+        }
+    
+    def search(self, query: str, k: int = 5) -> List[str]:
+        """
+        Find the memories that best match a query
+        
+        Facts and preferences are ranked by the number of words they share with
+        the query, newer entries first on ties. If nothing matches, the most
+        recent memories are returned. The result is sorted by text, so the same
+        memories always come back in the same order.
+        """
         memories = self.load_memories()
-        summary = "\n=== LONG-TERM MEMORY ===\n"
+        entries = [(fact['content'], fact.get('timestamp', '')) for fact in memories['facts']]
+        entries += [(f"{key}: {value}", '') for key, value in memories['preferences'].items()]
+        
+        query_words = self._words(query)
+        scored = [(len(query_words & self._words(text)), timestamp, text) for text, timestamp in entries]
+        scored.sort(reverse=True)
+        
+        top = [text for score, _, text in scored[:k] if score > 0]
+        if not top:
+            top = [text for _, _, text in scored[:k]]
+        return sorted(top)
+    
+    def get_static_preamble(self) -> str:
+        """Get the memory header, identical on every call so it can stay in the cached prompt prefix"""
+        return "\n=== LONG-TERM MEMORY ===\n"
+    
+    def _format_memories(self, memories: Dict[str, Any], max_facts: Optional[int] = None) -> str:
+        """Format facts and preferences in a deterministic order"""
+        text = ""
         
         if memories['facts']:
-            summary += "\nKnown Facts:\n"
-            for fact in memories['facts']:
-                summary += f"- {fact['content']}\n"
+            # Only the top facts go into the prompt, listed in chronological order
+            facts = self._rank_facts(memories['facts'], max_facts)
+            text += "\nKnown Facts:\n"
+            for fact in sorted(facts, key=lambda f: (f.get('timestamp', ''), f['content'])):
+                text += f"- {fact['content']}\n"
         
         if memories['preferences']:
-            summary += "\nUser Preferences:\n"
-            for key, value in memories['preferences'].items():
-                summary += f"- {key}: {value}\n"
+            text += "\nUser Preferences:\n"
+            for key, value in sorted(memories['preferences'].items()):
+                text += f"- {key}: {value}\n"
         
-        return summary
+        return text
+    
+    def get_dynamic_block(self, max_facts: Optional[int] = None) -> Dict[str, str]:
+        """Get the current memories as a message to append after the main system prompt (at most max_facts facts)"""
+        return {'role': 'system', 'content': self._format_memories(self.load_memories(), max_facts)}
+    
+    def get_memory_pack(self) -> Tuple[str, str]:
+        """Get the formatted memories together with an md5 version of that text"""
+        text = self._format_memories(self.load_memories())
+        version = hashlib.md5(text.encode('utf-8')).hexdigest()
+        return text, version
+    
+    def get_memory_summary(self) -> str:
+        """Get a summary of all memories for the system prompt"""
+        return self.get_static_preamble() + self._format_memories(self.load_memories())
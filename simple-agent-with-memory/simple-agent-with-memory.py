@@ -1,33 +1,81 @@
-from llama_cpp import Llama
 from pathlib import Path
-import json
+import functools
 import sys
 
-# Add parent directory to path
-sys.path.append(str(Path(__file__).parent.parent))
+# Make the helper package importable (only once, even if several scripts share a process)
+root_dir = str(Path(__file__).resolve().parent.parent)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+from helper.model_loader import get_llama
+from helper.tool_args import resolve_tool_arguments, split_tool_calls
+
+# Sibling module, found through the script's own directory (sys.path[0])
 from memory_manager import MemoryManager
 
 # Get the directory of the current file
 current_dir = Path(__file__).parent
 
+# The example conversation is short, and the KV cache is allocated for all of
+# n_ctx upfront. 512 would not even hold the prompt with the tool schema.
+N_CTX = 1536
+# Upper bound for every answer (a tool call or a reply of a few sentences)
+MAX_TOKENS = 256
+# Room kept free for the rendered tool schema (about 320 tokens, not part of messages) and the next answer
+RESERVED_TOKENS = 320 + MAX_TOKENS
+# Budget of the stored memories message, so it always leaves room for the conversation
+MEMORY_TOKENS = 384
+
 # Initialize memory manager
 memory_manager = MemoryManager('./agent-memory.json')
 
-# Load existing memories and add to system prompt
-memory_summary = memory_manager.get_memory_summary()
-
+# The system prompt is fully static, so it stays identical across turns and
+# runs (and cacheable). The memories stored so far follow it in a separate
+# message, built once per conversation; memories saved with save_memory after
+# that are only reachable through recall_memory (see chat()).
+# /no_think switches off Qwen3's thinking mode, so a <think> block can't use up
+# the context left for the answer.
 system_prompt = f"""You are a helpful assistant with long-term memory.
-{memory_summary}
 
 When the user shares important information about themselves, their preferences, or facts 
-they want you to remember, use the saveMemory function to store it."""
+they want you to remember, use the save_memory function to store it.
 
-# Initialize and load the model
-llama = Llama(
-    model_path=str(current_dir / ".." / "models" / "Qwen3-1.7B-Q8_0.gguf"),
-    n_ctx=2000,
-    verbose=False
-)
+When you need information about the user that is not in the conversation, use the 
+recall_memory function to look it up.
+
+/no_think
+{memory_manager.get_static_preamble()}"""
+
+
+def get_model():
+    """Load the model on first use (get_llama returns the same instance on later calls)"""
+    # No prompt cache needed: every call only evaluates the tokens after the
+    # longest prefix it shares with what is already in the context. This only
+    # works as long as earlier messages are never rewritten, so memories saved
+    # during the session are not patched into the earlier messages.
+    return get_llama(str(current_dir / ".." / "models" / "Qwen3-1.7B-Q4_K_M.gguf"), N_CTX)
+
+
+@functools.lru_cache(maxsize=1024)
+def count_tokens(content: str) -> int:
+    """Number of tokens of a message text, so each message is tokenized only once"""
+    return len(get_model().tokenize(content.encode("utf-8"), add_bos=False))
+
+
+def get_memory_block() -> dict:
+    """
+    The stored memories as a system message that fits into MEMORY_TOKENS
+
+    The lowest-ranked facts are left out until the message fits. If the
+    preferences alone are too long, the message is cut off.
+    """
+    for max_facts in range(memory_manager.max_facts, -1, -1):
+        block = memory_manager.get_dynamic_block(max_facts)
+        if count_tokens(block["content"]) <= MEMORY_TOKENS:
+            return block
+
+    llama = get_model()
+    tokens = llama.tokenize(block["content"].encode("utf-8"), add_bos=False)[:MEMORY_TOKENS]
+    return {"role": "system", "content": llama.detokenize(tokens).decode("utf-8", errors="ignore")}
 
 
 # Define memory saving function
@@ -43,8 +91,18 @@ def save_memory(memory_type: str, content: str, key: str = None) -> str:
     return "Unknown memory type"
 
 
-# Function definitions for the model
-functions = [
+# Define memory recall function
+def recall_memory(query: str) -> str:
+    """Look up stored memories relevant to a query"""
+    results = memory_manager.search(query, k=5)
+    if not results:
+        return "No memories found"
+    return "\n".join(f"- {result}" for result in results)
+
+
+# Function definitions for the model (a tuple: passed unchanged to every call,
+# so the rendered tool schema stays identical and the prompt prefix is reused)
+functions = (
     {
         "name": "save_memory",
         "description": "Save important information to long-term memory (user preferences, facts, personal details)",
@@ -67,8 +125,42 @@ functions = [
             },
             "required": ["memory_type", "content"]
         }
+    },
+    {
+        "name": "recall_memory",
+        "description": "Look up information stored in long-term memory (user preferences, facts, personal details)",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "What to look for (e.g., 'favorite food')"
+                }
+            },
+            "required": ["query"]
+        }
     }
-]
+)
+
+# The same definitions in the OpenAI "tools" format (as in simple-agent), which
+# Qwen3's chat template lists in the prompt
+tools = tuple({"type": "function", "function": function} for function in functions)
+
+
+# GBNF grammars for the arguments, used if the model writes unusable ones
+# (with tool_choice="auto" the calls are plain text, not grammar-constrained)
+TOOL_GRAMMARS = {
+    "save_memory": r'''
+root   ::= "{" ws "\"memory_type\"" ws ":" ws ("\"fact\"" | "\"preference\"") ws "," ws "\"content\"" ws ":" ws string (ws "," ws "\"key\"" ws ":" ws string)? ws "}"
+string ::= "\"" ([^"\\] | "\\" ["\\/bfnrt])* "\""
+ws     ::= [ \t\n]*
+''',
+    "recall_memory": r'''
+root   ::= "{" ws "\"query\"" ws ":" ws string ws "}"
+string ::= "\"" ([^"\\] | "\\" ["\\/bfnrt])* "\""
+ws     ::= [ \t\n]*
+'''
+}
 
 
 def execute_function_call(function_name: str, arguments: dict) -> str:
@@ -79,31 +171,43 @@ def execute_function_call(function_name: str, arguments: dict) -> str:
             content=arguments.get("content"),
             key=arguments.get("key")
         )
+    elif function_name == "recall_memory":
+        return recall_memory(query=arguments.get("query", ""))
     else:
         return f"Error: Unknown function {function_name}"
 
 
 def chat(user_message: str, messages: list) -> str:
     """Send a message and get a response, handling function calls"""
+    llama = get_model()
     messages.append({"role": "user", "content": user_message})
     
+    # Fail early instead of running out of context in the middle of an answer
+    used = sum(count_tokens(message["content"]) for message in messages if message.get("content"))
+    if used > N_CTX - RESERVED_TOKENS:
+        raise ValueError("Conversation does not fit into the context")
+    
     response = llama.create_chat_completion(
         messages=messages,
-        tools=functions,
-        tool_choice="auto"
+        tools=tools,
+        tool_choice="auto",
+        max_tokens=MAX_TOKENS
     )
     
-    message = response["choices"][0]["message"]
+    # With tool_choice="auto" the handler leaves the model's tool calls in the
+    # text, so they are parsed here
+    content, tool_calls = split_tool_calls(response["choices"][0]["message"].get("content") or "")
     
     # Check if the model wants to call a function
-    if "tool_calls" in message and message["tool_calls"]:
+    if tool_calls:
         # Add assistant message with tool call
-        messages.append(message)
+        context = list(messages)
+        messages.append({"role": "assistant", "content": content, "tool_calls": tool_calls})
         
         # Execute each tool call
-        for tool_call in message["tool_calls"]:
+        for tool_call in tool_calls:
             function_name = tool_call["function"]["name"]
-            function_args = json.loads(tool_call["function"]["arguments"]) if tool_call["function"]["arguments"] else {}
+            function_args = resolve_tool_arguments(llama, context, tool_call, functions, TOOL_GRAMMARS)
             
             # Execute the function
             function_response = execute_function_call(function_name, function_args)
@@ -115,33 +219,42 @@ def chat(user_message: str, messages: list) -> str:
                 "content": function_response
             })
         
-        # Get final response from model
+        # Get final response from model. No further tool calls, but the tools
+        # are still sent: they are part of the prefix already in the context, so only the
+        # tool results need to be evaluated.
         final_response = llama.create_chat_completion(
             messages=messages,
-            tools=functions
+            tools=tools,
+            tool_choice="none",
+            max_tokens=MAX_TOKENS
         )
         
         answer = final_response["choices"][0]["message"]["content"]
         messages.append({"role": "assistant", "content": answer})
     else:
         # Model responded without function call
-        answer = message.get("content", "")
+        answer = content
         messages.append({"role": "assistant", "content": answer})
     
     return answer
 
 
-# Example conversation
-messages = [{"role": "system", "content": system_prompt}]
+if __name__ == "__main__":
+    # Example conversation. The memories are in the prompt from the start, so
+    # they are also available when the model answers without a tool call.
+    messages = [
+        {"role": "system", "content": system_prompt},
+        get_memory_block()
+    ]
 
-# First interaction
-prompt1 = "Hi! My name is Alex and I love pizza."
-response1 = chat(prompt1, messages)
-print(f"User: {prompt1}")
-print(f"AI: {response1}\n")
+    # First interaction
+    prompt1 = "Hi! My name is Alex and I love pizza."
+    response1 = chat(prompt1, messages)
+    print(f"User: {prompt1}")
+    print(f"AI: {response1}\n")
 
-# Later conversation (even after restarting the script)
-prompt2 = "What's my favorite food?"
-response2 = chat(prompt2, messages)
-print(f"User: {prompt2}")
-print(f"AI: {response2}")
+    # Later conversation (even after restarting the script)
+    prompt2 = "What's my favorite food?"
+    response2 = chat(prompt2, messages)
+    print(f"User: {prompt2}")
+    print(f"AI: {response2}")
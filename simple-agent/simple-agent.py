@@ -1,32 +1,43 @@
-from llama_cpp import Llama
 from pathlib import Path
-import json
-from datetime import datetime
 import sys
 
-# Add parent directory to path to import helper
-sys.path.append(str(Path(__file__).parent.parent))
+# Make the helper package importable (only once, even if several scripts share a process)
+root_dir = str(Path(__file__).resolve().parent.parent)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+from helper.model_loader import get_llama
+from helper.tool_args import parse_tool_arguments
 from helper.prompt_debugger import PromptDebugger
 
 # Get the directory of the current file
 current_dir = Path(__file__).parent
 
-# Initialize and load the model
-llama = Llama(
-    model_path=str(current_dir / ".." / "models" / "Qwen3-1.7B-Q8_0.gguf"),
-    n_ctx=2000,
-    verbose=False
-)
+# One question, one tool call and the answer: a small context keeps the KV cache small
+N_CTX = 512
+# Upper bound for the final answer (a time conversion needs a few dozen tokens)
+MAX_TOKENS = 128
 
+
+def get_model():
+    """Load the model on first use (get_llama returns the same instance on later calls)"""
+    return get_llama(str(current_dir / ".." / "models" / "Qwen3-1.7B-Q4_K_M.gguf"), N_CTX)
+
+
+# /no_think switches off Qwen3's thinking mode: with N_CTX = 512, a <think> block
+# could use up the room left after the prompt, tool call and tool result
 system_prompt = """You are a professional chronologist who standardizes time representations across different systems.
     
 Always convert times from 12-hour format (e.g., "1:46:36 PM") to 24-hour format (e.g., "13:46") without seconds 
-before returning them."""
+before returning them.
+
+/no_think"""
 
 
 # Define tool/function for getting current time
 def get_current_time() -> str:
     """Get the current time"""
+    from datetime import datetime
+
     return datetime.now().strftime("%I:%M:%S %p")
 
 
@@ -43,6 +54,10 @@ functions = [
 ]
 
 
+# The same definitions in the OpenAI "tools" format, which a forced tool_choice needs
+tools = [{"type": "function", "function": function} for function in functions]
+
+
 def execute_function_call(function_name: str, arguments: dict) -> str:
     """Execute a function call based on the function name"""
     if function_name == "get_current_time":
@@ -51,66 +66,82 @@ def execute_function_call(function_name: str, arguments: dict) -> str:
         return f"Error: Unknown function {function_name}"
 
 
-# Build messages
-messages = [
-    {"role": "system", "content": system_prompt},
-    {"role": "user", "content": "What time is it right now?"}
-]
+def main():
+    llama = get_model()
 
-# Create chat completion with function calling
-response = llama.create_chat_completion(
-    messages=messages,
-    tools=functions,
-    tool_choice="auto"
-)
-
-# Check if the model wants to call a function
-message = response["choices"][0]["message"]
-
-if "tool_calls" in message and message["tool_calls"]:
-    # Extract function call
-    tool_call = message["tool_calls"][0]
-    function_name = tool_call["function"]["name"]
-    function_args = json.loads(tool_call["function"]["arguments"]) if tool_call["function"]["arguments"] else {}
-    
-    print(f"Model wants to call function: {function_name}")
-    
-    # Execute the function
-    function_response = execute_function_call(function_name, function_args)
-    print(f"Function returned: {function_response}")
-    
-    # Add the function call and response to messages
-    messages.append(message)
-    messages.append({
-        "role": "tool",
-        "tool_call_id": tool_call["id"],
-        "content": function_response
-    })
-    
-    # Get final response from model
-    final_response = llama.create_chat_completion(
+    # Build messages
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": "What time is it right now?"}
+    ]
+
+    # Create chat completion with function calling. The question always needs
+    # the current time, so the call is forced instead of letting the model decide.
+    response = llama.create_chat_completion(
         messages=messages,
-        tools=functions
+        tools=tools,
+        tool_choice={"type": "function", "function": {"name": "get_current_time"}}
     )
-    
-    answer = final_response["choices"][0]["message"]["content"]
-else:
-    # Model responded without function call
-    answer = message.get("content", "")
-
-print(f"AI: {answer}")
-
-# Debug the prompts
-prompt_debugger = PromptDebugger({
-    'outputDir': './logs',
-    'filename': 'qwen_prompts.txt',
-    'includeTimestamp': True,
-    'appendMode': False
-})
-
-# Log the conversation
-prompt_debugger.debug({
-    'messages': messages,
-    'functions': functions,
-    'response': answer
-})
+
+    # Check if the model wants to call a function
+    message = response["choices"][0]["message"]
+
+    if "tool_calls" in message and message["tool_calls"]:
+        # Extract function call
+        tool_call = message["tool_calls"][0]
+        function_name = tool_call["function"]["name"]
+        # The forced tool_choice already samples the arguments under a grammar
+        # built from the function's JSON schema, so they always parse
+        function_args = parse_tool_arguments(tool_call["function"]["arguments"])
+
+        print(f"Model wants to call function: {function_name}")
+
+        # Execute the function
+        function_response = execute_function_call(function_name, function_args)
+        print(f"Function returned: {function_response}")
+
+        # Add the function call and response to messages
+        messages.append(message)
+        messages.append({
+            "role": "tool",
+            "tool_call_id": tool_call["id"],
+            "content": function_response
+        })
+
+        # Get final response from model. No further tool calls, but the tools
+        # are still sent: they are part of the prompt prefix evaluated before,
+        # so only the new messages need to be evaluated.
+        final_response = llama.create_chat_completion(
+            messages=messages,
+            tools=tools,
+            tool_choice="none",
+            max_tokens=MAX_TOKENS
+        )
+
+        answer = final_response["choices"][0]["message"]["content"]
+    else:
+        # Model responded without function call
+        answer = message.get("content", "")
+
+    print(f"AI: {answer}")
+
+    # Debug the prompts
+    prompt_debugger = PromptDebugger({
+        'outputDir': './logs',
+        'filename': 'qwen_prompts.jsonl',
+        'includeTimestamp': True,
+        'appendMode': False
+    })
+
+    # Log the conversation
+    prompt_debugger.debug({
+        'messages': messages,
+        'functions': functions,
+        'response': answer
+    })
+
+    prompt_debugger.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,24 @@
-from llama_cpp import Llama
 from pathlib import Path
+import sys
+
+# Make the helper package importable (only once, even if several scripts share a process)
+root_dir = str(Path(__file__).resolve().parent.parent)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+from helper.model_loader import get_llama
+from helper.prompt_state import load_system_prompt_state
+from helper.stream_buffer import StreamBuffer
 
 # Get the directory of the current file
 current_dir = Path(__file__).parent
 
-# Initialize and load the model
-llama = Llama(
-    model_path=str(current_dir / ".." / "models" / "Qwen3-1.7B-Q8_0.gguf"),
-    n_ctx=2048,
-    verbose=False
-)
+# Qwen3's recommended sampler settings for thinking mode; greedy decoding makes
+# it repeat itself inside the <think> block
+TEMPERATURE = 0.6
+TOP_P = 0.95
+TOP_K = 20
+# Room for the <think> block and the answer next to the ~350 prompt tokens
+MAX_TOKENS = 1536
 
 system_prompt = """You are an expert logical and quantitative reasoner.
 Your goal is to analyze real-world word problems involving families, quantities, averages, and relationships 
@@ -29,13 +38,38 @@ second cousins don't eat carbs. The average potato is about half a pound, and po
 How many whole bags of potatoes do I need? 
 """
 
-# Create chat completion
-response = llama.create_chat_completion(
-    messages=[
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": prompt}
-    ]
-)
 
-answer = response["choices"][0]["message"]["content"]
-print(f"AI: {answer}")
+def main():
+    # Load the model (shared with other scripts running in the same process)
+    llama = get_llama(str(current_dir / ".." / "models" / "Qwen3-1.7B-Q4_K_M.gguf"), 2048)
+
+    # Restore the saved state of the system prompt, so only the user prompt
+    # needs to be evaluated. The sampled answer itself is not worth caching.
+    load_system_prompt_state(llama, system_prompt)
+
+    # Create chat completion
+    response = llama.create_chat_completion(
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=TEMPERATURE,
+        top_p=TOP_P,
+        top_k=TOP_K,
+        max_tokens=MAX_TOKENS,
+        stream=True
+    )
+
+    # Print the answer while it is generated
+    print("AI: ", end="", flush=True)
+    buf = StreamBuffer()
+    for chunk in response:
+        content = chunk["choices"][0]["delta"].get("content")
+        if content:
+            buf.add(content)
+    buf.flush()
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,42 @@
-from llama_cpp import Llama
 from pathlib import Path
+import re
+import sys
+
+# Make the helper package importable (only once, even if several scripts share a process)
+root_dir = str(Path(__file__).resolve().parent.parent)
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+from helper.batched_decoding import batched_chat_completion
+from helper.llm_cache import cached_chat_completion
+from helper.model_loader import get_llama
+from helper.prompt_state import load_system_prompt_state
+from helper.stream_buffer import StreamBuffer
 
 # Get the directory of the current file
 current_dir = Path(__file__).parent
 
-# Initialize and load the model
-llama = Llama(
-    model_path=str(current_dir / ".." / "models" / "hf_giladgd_Apertus-8B-Instruct-2509.Q6_K.gguf"),
-    n_ctx=2048,
-    verbose=False
-)
-
-system_prompt = """Du bist ein erfahrener wissenschaftlicher Übersetzer für technische Texte aus dem Englischen ins 
-Deutsche.
-
-Deine Aufgabe: Erstelle eine inhaltlich exakte Übersetzung, die den vollen Sinn und die technische Präzision 
-des Originaltexts erhält.
 
-Gleichzeitig soll die Übersetzung klar, natürlich und leicht lesbar auf Deutsch klingen – also so, wie ein 
-deutscher Wissenschaftler oder Ingenieur denselben Text schreiben würde.
+def get_model():
+    """Load the model on first use (get_llama returns the same instance on later calls)"""
+    return get_llama(str(current_dir / ".." / "models" / "hf_giladgd_Apertus-8B-Instruct-2509.Q4_K_M.gguf"), 2048)
 
-Befolge diese Regeln:
-Bewahre jede fachliche Aussage und Nuance exakt. Kein Inhalt darf verloren gehen oder verändert werden.
-Verwende idiomatisches, flüssiges Deutsch, wie es in wissenschaftlichen Abstracts (z. B. NeurIPS, ICLR, AAAI) üblich ist.
-Vermeide wörtliche Satzstrukturen. Formuliere so, wie ein deutscher Wissenschaftler denselben Inhalt selbst schreiben würde.
-Verwende korrekte Terminologie (z. B. Multi-Agenten-System, Adapterlayer, Baseline, Strategieverbesserung).
-Verwende bei Zahlen, Einheiten und Prozentangaben deutsche Typografie (z. B. „54 %", „3 m", „2 000").
-Passe zusammengesetzte Begriffe an die deutsche Grammatik an (z. B. „kontinuierlich lernendes System" statt „kontinuierliches Lernen System").
-Kürze lange oder verschachtelte Sätze behutsam, ohne Bedeutung zu verändern, um Lesbarkeit zu verbessern.
-Verwende einen neutralen, wissenschaftlichen Stil, ohne Werbesprache oder unnötige Ausschmückung.
 
-Zusatzinstruktion:
-Wenn der Originaltext englische Satzlogik enthält, restrukturiere den Satz so, dass er auf Deutsch elegant und klar klingt, aber denselben Inhalt vermittelt.
+# Kept short: every token here is prefilled for each translation
+system_prompt = """Du bist wissenschaftlicher Fachübersetzer (Englisch → Deutsch).
 
-Zielqualität: Eine Übersetzung, die sich wie ein Originaltext liest – technisch präzise, flüssig und grammatikalisch einwandfrei.
+Regeln:
+1. Inhalt exakt übernehmen: jede fachliche Aussage und Nuance, nichts weglassen oder hinzufügen.
+2. Idiomatisches, flüssiges Deutsch im Stil wissenschaftlicher Abstracts (NeurIPS, ICLR, AAAI); keine wörtlichen Satzstrukturen.
+3. Korrekte Terminologie (z. B. Multi-Agenten-System, Adapterlayer, Baseline).
+4. Deutsche Typografie für Zahlen und Einheiten („54 %", „3 m", „2 000").
+5. Komposita nach deutscher Grammatik („kontinuierlich lernendes System").
+6. Lange Sätze behutsam kürzen oder umstellen, ohne die Bedeutung zu ändern.
+7. Neutraler Stil, keine Ausschmückung.
 
-DO NOT add any addition text or explanation. ONLY respond with the translated text
+ONLY respond with the translated text, no explanation.
 """
 
-q1 = """Translate this text into german: 
-
-We address the long-horizon gap in large language model (LLM) agents by en-
+abstract = """We address the long-horizon gap in large language model (LLM) agents by en-
 abling them to sustain coherent strategies in adversarial, stochastic environments.
 Settlers of Catan provides a challenging benchmark: success depends on balanc-
 ing short- and long-term goals amid randomness, trading, expansion, and block-
@@ -59,13 +55,106 @@ all, artifact-centric continual learning transforms LLMs from brittle stepwise d
 ciders into stable strategy designers, advancing long-horizon autonomy.
 """
 
-# Create chat completion
-response = llama.create_chat_completion(
-    messages=[
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": q1}
+
+def translate(texts: list, stream: bool = False) -> list:
+    """
+    Translate a list of texts, one answer per text
+
+    A single text goes through the cached chat completion. Several texts are
+    translated together with batched decoding: each one is its own sequence,
+    so N translations take little longer than one.
+
+    With stream=True the translations are also printed while they are
+    generated: a single text token by token, several texts one line each, in
+    order, as soon as a text and all texts before it are done.
+    """
+    llama = get_model()
+    conversations = [
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ]
+        for text in texts
     ]
-)
+    # Upper bound per translation, so a model stuck in a loop cannot fill the context
+    max_tokens = 1024
+
+    if len(conversations) == 1:
+        # Greedy decoding suits translation (Apertus has no thinking mode) and lets
+        # repeated runs be answered from the cache. On a cache miss, the saved
+        # state of the system prompt is restored first.
+        response = cached_chat_completion(
+            llama,
+            prepare=lambda: load_system_prompt_state(llama, system_prompt),
+            messages=conversations[0],
+            temperature=0,
+            max_tokens=max_tokens,
+            stream=stream
+        )
+        if not stream:
+            return [response["choices"][0]["message"]["content"]]
+
+        buf = StreamBuffer()
+        for chunk in response:
+            content = chunk["choices"][0]["delta"].get("content")
+            if content:
+                buf.add(content)
+        buf.flush()
+        print()
+        return [buf.text()]
+
+    done = {}
+    next_index = 0
+
+    def print_ready(index: int, answer: str) -> None:
+        nonlocal next_index
+        done[index] = answer
+        while next_index in done:
+            print(done.pop(next_index), flush=True)
+            next_index += 1
+
+    # The system prompt is shared, but every text adds its prompt and answer
+    return batched_chat_completion(
+        llama,
+        conversations,
+        n_ctx=4096,
+        n_batch=512,
+        max_tokens=max_tokens,
+        temperature=0,  # Same (greedy) decoding as the single-text path
+        on_done=print_ready if stream else None
+    )
+
+
+def split_sentences(text: str) -> list:
+    """Split a paragraph into sentences, rejoining words hyphenated at line breaks"""
+    text = re.sub(r"-\n(?=[a-z])", "", text)
+    text = " ".join(text.split())
+    return re.split(r"(?<=[.!?])\s+", text)
+
+
+def translate_paragraph(text: str, stream: bool = False) -> str:
+    """
+    Translate a paragraph sentence by sentence in one batch
+
+    Every sentence is its own sequence, so they are decoded in parallel. Each
+    prompt also carries the previous sentence as context, so pronouns and
+    terms referring back to it are still translated consistently. With
+    stream=True every sentence is printed as soon as it is translated.
+    """
+    sentences = split_sentences(text)
+    prompts = []
+    for i, sentence in enumerate(sentences):
+        prompt = f"Translate this sentence into german: {sentence}"
+        if i > 0:
+            prompt = f"Previous sentence (context only, do not translate): {sentences[i - 1]}\n\n{prompt}"
+        prompts.append(prompt)
+
+    return " ".join(translate(prompts, stream=stream))
+
 
-answer = response["choices"][0]["message"]["content"]
-print(f"AI: {answer}")
+if __name__ == "__main__":
+    # The abstract is translated sentence by sentence with batched decoding.
+    # translate([abstract], stream=True) would take the single-text path
+    # instead: response cache, saved system prompt state and token streaming.
+    print("AI:")
+    translate_paragraph(abstract, stream=True)